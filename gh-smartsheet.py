@@ -1,16 +1,70 @@
 #!/usr/bin/env python3
+import functools
 import os
+import pickle
 import sys
-from github import Github
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import AuthBase
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
+# Concurrent GitHub page fetches; kept low to avoid secondary rate limits
+GITHUB_PAGE_WORKERS = 5
+
+# (connect, read) timeout in seconds applied to every session request
+DEFAULT_TIMEOUT = (5, 60)
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies DEFAULT_TIMEOUT when a request sets no timeout."""
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = DEFAULT_TIMEOUT
+        return super().send(request, **kwargs)
+
+
+# Single pooled session so every API call reuses the same keep-alive connection.
+# Requests time out after DEFAULT_TIMEOUT, so a stalled socket cannot hang a worker.
+# Transient 429/5xx responses and read timeouts on GET/PUT are retried by the
+# adapter on that connection, honouring Retry-After; the final response is
+# returned for raise_for_status. POST is left out: a retried add after a 5xx or
+# read timeout may duplicate rows, so send_batch retries POSTs on 429 only.
+RETRY = Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=["GET", "PUT"],
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    TimeoutHTTPAdapter(pool_connections=4, pool_maxsize=20, max_retries=RETRY),
+)
+
+# Column ids per sheet, so repeated syncs in one process skip the lookup
+_COLUMN_CACHE = {}
+
+# Sheet rows from the last run, reused while the sheet version is unchanged
+ROWS_CACHE_PATH = os.path.join(os.path.dirname(__file__), ".sheet.cache")
+
 # -----------------------------
 # ENV
 # -----------------------------
+@functools.lru_cache(maxsize=1)
 def check_env():
 
-    load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
+    # Containers inject the env directly, so only parse .env if it exists
+    envpath = os.path.join(os.path.dirname(__file__), ".env")
+    if os.path.exists(envpath):
+        load_dotenv(dotenv_path=envpath)
 
     GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
     SMARTSHEET_TOKEN = os.getenv("SMARTSHEET_TOKEN")
@@ -34,93 +88,181 @@ def check_env():
 # GITHUB
 # -----------------------------
 
-def collect_github_issues(token):
+Issue = namedtuple("Issue", "number title state")
+
+def iter_github_issues(token):
     """
-    Fetch issues from the same repo used in gh_access
-    Returns list of dicts: {number, title, state}
+    Fetch issues from the same repo used in gh_access via the REST API.
+    The first page's Link header gives the last page number; the remaining
+    pages are then fetched concurrently. Pull requests are skipped.
+    Yields Issue(number, title, state) tuples.
     """
-    g = Github(token)
-    repo = g.get_repo("innabox/issues")
-    
-    for issue in repo.get_issues(state="all"):
-        print(f"#{issue.number} {issue.title} — {issue.state}")
-    
-    data = []
-    for issue in repo.get_issues(state="all"):
-        data.append({
-            "number": issue.number,
-            "title": issue.title,
-            "state": issue.state
-        })
-    return data
+    url = "https://api.github.com/repos/innabox/issues/issues"
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/vnd.github+json",
+    }
+    params = {"state": "all", "per_page": 100}
+
+    def fetch_page(page):
+        r = SESSION.get(url, headers=headers, params={**params, "page": page})
+        r.raise_for_status()
+        return r
+
+    first = fetch_page(1)
+    last_url = first.links.get("last", {}).get("url")
+    last = int(parse_qs(urlparse(last_url).query)["page"][0]) if last_url else 1
+
+    def issues_in(resp):
+        # Skip pull requests, which the issues endpoint also returns;
+        # state is only "open"/"closed", so intern it
+        page = [
+            Issue(issue["number"], issue["title"], sys.intern(issue["state"]))
+            for issue in resp.json()
+            if "pull_request" not in issue
+        ]
+        # One buffered write per page instead of a print per issue
+        if page:
+            sys.stdout.write("".join(f"#{i.number} {i.title} — {i.state}\n" for i in page))
+        return page
+
+    yield from issues_in(first)
+    if last > 1:
+        with ThreadPoolExecutor(max_workers=GITHUB_PAGE_WORKERS) as ex:
+            # map() keeps page order, so issues come out as GitHub sorted them
+            for resp in ex.map(fetch_page, range(2, last + 1)):
+                yield from issues_in(resp)
 
 
 # -----------------------------
 # SMARTSHEET helpers
 # -----------------------------
-def sm_headers(token):
-    return {
-        "Authorization": f"Bearer {token}",
-        "Accept": "application/json",
-        "Content-Type": "application/json"
+class SmartsheetAuth(AuthBase):
+    """
+    Attach the Smartsheet headers to a single request.
+    Passed as auth= on Smartsheet calls only, so the token never reaches GitHub
+    through the shared session.
+    """
+    def __init__(self, token):
+        self.headers = {
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/json",
+            "Content-Type": "application/json"
+        }
+
+    def __call__(self, r):
+        r.headers.update(self.headers)
+        return r
+
+def load_rows_cache(sheet_id, columns):
+    """Return (version, rows) cached by a previous run for this sheet, or (None, None)."""
+    try:
+        with open(ROWS_CACHE_PATH, "rb") as f:
+            cached = pickle.load(f)
+    except Exception:
+        # Missing, unreadable or corrupt cache -> fetch the sheet normally
+        return None, None
+    if not isinstance(cached, dict) or not isinstance(cached.get("rows"), list):
+        return None, None
+    if cached.get("sheet_id") != sheet_id or cached.get("columns") != columns:
+        return None, None
+    return cached.get("version"), cached.get("rows")
+
+def save_rows_cache(sheet_id, columns, version, rows):
+    """Best-effort cache write; a read-only script directory just skips caching."""
+    try:
+        with open(ROWS_CACHE_PATH, "wb") as f:
+            pickle.dump(
+                {"sheet_id": sheet_id, "columns": columns, "version": version, "rows": rows},
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+    except OSError as e:
+        print(f"Warning: could not write sheet cache {ROWS_CACHE_PATH}: {e}", file=sys.stderr)
+
+def fetch_all_rows(sheet_id, col_ids, auth):
+    """
+    Return all rows for the sheet (handles pagination via includeAll).
+    Only cells for the synced columns are requested, to keep the payload small.
+    Rows are cached on disk with the sheet version; when the sheet has not changed
+    since, Smartsheet answers ifVersionAfter with just the version and the cached
+    rows are reused.
+    """
+    url = f"https://api.smartsheet.com/2.0/sheets/{sheet_id}"
+    columns = ",".join(str(cid) for cid in col_ids.values())
+    params = {
+        "includeAll": "true",
+        "columnIds": columns,
+        "exclude": "nonexistentCells",
     }
 
-def fetch_all_rows(sheet_id, token):
-    """Return all rows for the sheet (handles pagination via includeAll)."""
-    url = f"https://api.smartsheet.com/2.0/sheets/{sheet_id}"
-    resp = requests.get(url, headers=sm_headers(token), params={"includeAll": "true"})
+    cached_version, cached_rows = load_rows_cache(sheet_id, columns)
+    if cached_version is not None:
+        params["ifVersionAfter"] = cached_version
+
+    resp = SESSION.get(url, params=params, auth=auth)
     resp.raise_for_status()
-    return resp.json().get("rows", [])
+    sheet = resp.json()
+
+    # Abbreviated response: only "version" is returned when nothing changed
+    if "rows" not in sheet and sheet.get("version") == cached_version:
+        return cached_rows
+
+    rows = sheet.get("rows", [])
+    save_rows_cache(sheet_id, columns, sheet.get("version"), rows)
+    return rows
 
 def build_sheet_index(rows, col_ids):
     """
     Build a lookup: (issue_number, title) -> {"rowId": <id>, "status": <value or displayValue>}
     """
-    id_issue  = col_ids["Issue Number"]
-    id_title  = col_ids["Title"]
-    id_status = col_ids["Status"]
-
-    def cell_value(cell):
-        return cell.get("value", cell.get("displayValue"))
+    # Column id -> slot in the per-row [number, title, status] list
+    slot = {
+        col_ids["Issue Number"]: 0,
+        col_ids["Title"]: 1,
+        col_ids["Status"]: 2,
+    }
 
     index = {}
     for row in rows:
-        num = title = status = None
+        vals = [None, None, None]
         for c in row.get("cells", []):
-            cid = c.get("columnId")
-            if cid == id_issue:
-                num = cell_value(c)
-            elif cid == id_title:
-                title = cell_value(c)
-            elif cid == id_status:
-                status = cell_value(c)
-
-        if num is not None and title is not None:
-            # Normalize number key to int when possible
-            try:
-                num_key = int(num)
-            except (TypeError, ValueError):
-                num_key = str(num)
-            index[(num_key, str(title))] = {"rowId": row["id"], "status": status}
+            i = slot.get(c.get("columnId"))
+            if i is not None:
+                vals[i] = c.get("value", c.get("displayValue"))
+
+        num, title, status = vals
+        if num is None or title is None:
+            continue
+
+        # Normalize number key to int when possible
+        try:
+            num_key = int(num)
+        except (TypeError, ValueError):
+            num_key = str(num)
+        index[(num_key, str(title))] = {"rowId": row["id"], "status": status}
     return index
 
-def fetch_smartsheet(sheet_id, token):
+def fetch_columns(sheet_id, auth):
     """
-    Fetch metadata for a specific Smartsheet.
-    Returns the parsed JSON.
+    Fetch the column definitions for a specific Smartsheet.
+    Returns a list of column dicts.
     """
-    url = f"https://api.smartsheet.com/2.0/sheets/{sheet_id}"
-    resp = requests.get(url, headers=sm_headers(token))
+    url = f"https://api.smartsheet.com/2.0/sheets/{sheet_id}/columns"
+    resp = SESSION.get(url, params={"includeAll": "true"}, auth=auth)
     resp.raise_for_status()
-    return resp.json()
+    return resp.json().get("data", [])
 
-def get_or_create_columns(sheet_id, token):
+def get_or_create_columns(sheet_id, auth):
     """
     Ensure the sheet has columns: Issue Number, Title, Status (TEXT_NUMBER).
     Return a dict: { "Issue Number": id, "Title": id, "Status": id }
     """
-    sheet = fetch_smartsheet(sheet_id, token)
-    existing = {c["title"]: c for c in sheet.get("columns", [])}
+    if sheet_id in _COLUMN_CACHE:
+        return _COLUMN_CACHE[sheet_id]
+
+    columns = fetch_columns(sheet_id, auth)
+    existing = {c["title"]: c for c in columns}
 
     required = [
         ("Issue Number", "TEXT_NUMBER"),
@@ -128,92 +270,106 @@ def get_or_create_columns(sheet_id, token):
         ("Status", "TEXT_NUMBER"),
     ]
 
-    def extract_id(resp_json):
-        # Smartsheet returns {"message":"SUCCESS","resultCode":0,"result": {…column…}}
-        # or result: [ {…}, {…} ] for bulk calls.
+    def extract_columns(resp_json):
+        # Smartsheet returns {"message":"SUCCESS","resultCode":0,"result": [ {…}, {…} ]}
+        # for bulk calls, or result: {…column…} when a single column is created.
         if isinstance(resp_json, dict) and "result" in resp_json:
             res = resp_json["result"]
-            if isinstance(res, list):
-                return res[0]["id"]
-            return res["id"]
-        # Fallback: some SDK/helpers may return the raw Column object
-        if isinstance(resp_json, dict) and "id" in resp_json:
-            return resp_json["id"]
+            return res if isinstance(res, list) else [res]
         raise ValueError(f"Unexpected column-create response shape: {resp_json}")
 
-    col_ids = {}
-    next_index = len(sheet.get("columns", []))
+    col_ids = {title: existing[title]["id"] for title, _ in required if title in existing}
 
-    for title, col_type in required:
-        if title in existing:
-            col_ids[title] = existing[title]["id"]
-            continue
+    # Smartsheet inserts every column in a bulk add at the same index, in order
+    next_index = len(columns)
+    missing = [
+        {"title": title, "type": col_type, "index": next_index}
+        for title, col_type in required
+        if title not in existing
+    ]
 
+    if missing:
         url = f"https://api.smartsheet.com/2.0/sheets/{sheet_id}/columns"
-        payload = {"title": title, "type": col_type, "index": next_index}
-        r = requests.post(url, headers=sm_headers(token), json=payload)
-        r.raise_for_status()
-        created = r.json()
-        col_ids[title] = extract_id(created)
-        next_index += 1
+        r = send_batch("post", url, missing, auth)
+        for col in extract_columns(r.json()):
+            col_ids[col["title"]] = col["id"]
 
+    _COLUMN_CACHE[sheet_id] = col_ids
     return col_ids
 
 
-def add_issue_rows(sheet_id, token, issues, col_ids, batch_size=300):
+def send_batch(method, url, group, auth, retries=5):
+    """
+    Send one batch. PUTs are retried by the session adapter; POSTs are not,
+    so a POST answered with 429 (nothing applied) is backed off and retried here.
+    """
+    body = orjson.dumps(group)
+    for attempt in range(retries):
+        r = SESSION.request(method, url, data=body, auth=auth)
+        if method != "post" or r.status_code != 429 or attempt == retries - 1:
+            break
+        delay = r.headers.get("Retry-After", "")
+        time.sleep(int(delay) if delay.isdigit() else 2 ** attempt)
+    r.raise_for_status()
+    return r
+
+
+def add_issue_rows(sheet_id, issues, col_ids, auth, batch_size=300):
     """
     Add new issues as rows if (issue number + title) not present.
     If present and status differs, update the Status cell in place.
+    `issues` may be any iterable (e.g. a generator); it is consumed once and
+    collected into a (number, title) -> state dict for the diff.
     """
     def chunk(seq, n):
         for i in range(0, len(seq), n):
             yield seq[i:i+n]
 
     # Build current index of rows -> (issue number, title)
-    existing_rows = fetch_all_rows(sheet_id, token)
+    existing_rows = fetch_all_rows(sheet_id, col_ids, auth)
     index = build_sheet_index(existing_rows, col_ids)
 
-    to_add = []
-    to_update = []
-
-    for it in issues:
-        key = (it["number"], it["title"])
-        current = index.get(key)
-
-        if current is None:
-            # Not found -> add new row
-            to_add.append({
-                #"toBottom": True,
-                "cells": [
-                    {"columnId": col_ids["Issue Number"], "value": it["number"]},
-                    {"columnId": col_ids["Title"],        "value": it["title"]},
-                    {"columnId": col_ids["Status"],       "value": it["state"]},
-                ]
-            })
-        else:
-            # Found -> update status only if it changed (or missing)
-            existing_status = current.get("status")
-            if str(existing_status).lower() != str(it["state"]).lower():
-                to_update.append({
-                    "id": current["rowId"],
-                    "cells": [
-                        {"columnId": col_ids["Status"], "value": it["state"]}
-                    ]
-                })
-
-    # Apply adds
-    if to_add:
-        url = f"https://api.smartsheet.com/2.0/sheets/{sheet_id}/rows"
-        for group in chunk(to_add, batch_size):
-            r = requests.post(url, headers=sm_headers(token), json=group)
-            r.raise_for_status()
-
-    # Apply updates
-    if to_update:
-        url = f"https://api.smartsheet.com/2.0/sheets/{sheet_id}/rows"
-        for group in chunk(to_update, batch_size):
-            r = requests.put(url, headers=sm_headers(token), json=group)
-            r.raise_for_status()
+    # Diff GitHub against the sheet with dict/set operations:
+    # (issue number, title) -> state, and (issue number, title) -> lowercased status
+    gh = {(it.number, it.title): it.state for it in issues}
+    sheet_status = {k: str(v["status"]).lower() for k, v in index.items()}
+
+    # Not found -> add new row
+    added = gh.keys() - sheet_status.keys()
+    # Found -> update status only if it changed (or missing).
+    # GitHub states are already lowercase, so the items views can be diffed directly;
+    # only the mismatching pairs are visited in Python.
+    changed = {k for k, _ in gh.items() - sheet_status.items()} - added
+
+    # Rows are added in the order GitHub returned the issues
+    to_add = [
+        {
+            #"toBottom": True,
+            "cells": [
+                {"columnId": col_ids["Issue Number"], "value": k[0]},
+                {"columnId": col_ids["Title"],        "value": k[1]},
+                {"columnId": col_ids["Status"],       "value": gh[k]},
+            ]
+        }
+        for k in gh if k in added
+    ]
+    to_update = [
+        {
+            "id": index[k]["rowId"],
+            "cells": [
+                {"columnId": col_ids["Status"], "value": gh[k]}
+            ]
+        }
+        for k in changed
+    ]
+
+    # Apply adds, then updates. Smartsheet rejects concurrent writes to one sheet,
+    # so batches go out one at a time over the pooled session, keeping row order.
+    url = f"https://api.smartsheet.com/2.0/sheets/{sheet_id}/rows"
+    for group in chunk(to_add, batch_size):
+        send_batch("post", url, group, auth)
+    for group in chunk(to_update, batch_size):
+        send_batch("put", url, group, auth)
 
     print(f"Smartsheet sync complete. Added {len(to_add)} new rows, updated {len(to_update)} statuses.")
 
@@ -222,15 +378,14 @@ def add_issue_rows(sheet_id, token, issues, col_ids, batch_size=300):
 # -----------------------------
 def main():
     GITHUB_TOKEN, SMARTSHEET_TOKEN, SMARTSHEET_SHEET_ID = check_env()
+    sm_auth = SmartsheetAuth(SMARTSHEET_TOKEN)
 
     # Make sure the sheet exists and columns are ready
-    col_ids = get_or_create_columns(SMARTSHEET_SHEET_ID, SMARTSHEET_TOKEN)
-
-    # Collect issues
-    issues = collect_github_issues(GITHUB_TOKEN)
+    col_ids = get_or_create_columns(SMARTSHEET_SHEET_ID, sm_auth)
 
-    # Append rows to Smartsheet
-    add_issue_rows(SMARTSHEET_SHEET_ID, SMARTSHEET_TOKEN, issues, col_ids)
+    # Pass the issue generator straight to the Smartsheet sync
+    issues = iter_github_issues(GITHUB_TOKEN)
+    add_issue_rows(SMARTSHEET_SHEET_ID, issues, col_ids, sm_auth)
 
 
 if __name__ == "__main__":